@@ -2,10 +2,14 @@
 Pylint plugin: checks that feature toggles are properly annotated.
 """
 
+import functools
 import importlib.resources
+import io
+import os
 import re
 
-from astroid.nodes.node_classes import Const, Name
+from astroid.nodes.node_classes import Assign, Call, Const, Dict, Name
+from astroid.nodes.scoped_nodes import ClassDef
 from code_annotations import annotation_errors
 from code_annotations.base import AnnotationConfig
 from code_annotations.find_static import StaticSearch
@@ -38,54 +42,103 @@ def check_all_messages(msgs):
     return store_messages
 
 
-class AnnotationLines:
+class _ModuleCache:
     """
-    AnnotationLines provides utility methods to work with a string in terms of
-    lines.  As an example, it can convert a Call node into a list of its contents
-    separated by line breaks.
+    Data about the module being checked, shared between the checkers.
+
+    Only the data of a single module is kept: it is dropped as soon as another module is checked, and when the
+    checkers are closed. Modules are identified by their file and the id of their node, so that the cache does not
+    hold on to module ASTs.
     """
 
-    # Regex searches for annotations like: # .. toggle
-    _ANNOTATION_REGEX = re.compile(r"[\s]*#[\s]*\.\.[\s]*(toggle)")
+    def __init__(self):
+        self._key = None
+        self._data = {}
 
-    def __init__(self, module_node):
+    def get(self, module_node):
         """
-        Arguments:
-            module_node: The visited module node.
+        Get the dict of data cached for the module.
         """
-        module_as_binary = module_node.stream().read()
-
-        file_encoding = module_node.file_encoding
-        if file_encoding is None:
-            file_encoding = "UTF-8"
-
-        module_as_string = module_as_binary.decode(file_encoding)
-        self._list_of_string_lines = module_as_string.split("\n")
+        key = (module_node.file, id(module_node))
+        if key != self._key:
+            self.clear()
+            self._key = key
+        return self._data
 
-    def is_line_annotated(self, line_number):
+    def clear(self):
         """
-        Checks if the provided line number is annotated.
+        Drop all the cached data.
         """
-        if line_number < 1 or self._line_count() < line_number:
-            return False
+        self._key = None
+        self._data = {}
 
-        return bool(self._ANNOTATION_REGEX.match(self._get_line_contents(line_number)))
 
-    def _line_count(self):
-        """
-        Gets the number of lines in the string.
-        """
-        return len(self._list_of_string_lines)
+_module_cache = _ModuleCache()
+
+
+class ModuleCacheMixin:
+    """
+    Mixin for checkers which share module data through `get_module_source()` and the module cache.
 
-    def _get_line_contents(self, line_number):
+    The cached data is dropped when the checker is closed, at the end of a run.
+    """
+
+    def close(self):
         """
-        Gets the line of text designated by the provided line number.
+        Drop the data cached for the last checked module.
         """
-        return self._list_of_string_lines[line_number - 1]
+        super().close()
+        _module_cache.clear()
+
+
+def get_module_source(module_node):
+    """
+    Get the decoded source code of a module.
+
+    Several checkers need the source of the module being visited: it is read and decoded only once, and then shared
+    between them.
+    """
+    module_data = _module_cache.get(module_node)
+    if "source" in module_data:
+        return module_data["source"]
+
+    file_encoding = module_node.file_encoding
+    if file_encoding is None:
+        file_encoding = "UTF-8"
+
+    # Modules built from a string keep their source: use it rather than copying it into a new stream
+    module_as_binary = module_node.file_bytes
+    if module_as_binary is None:
+        with module_node.stream() as stream:
+            module_as_binary = stream.read()
+    if isinstance(module_as_binary, str):
+        source = module_as_binary
+    else:
+        source = module_as_binary.decode(file_encoding)
+    module_data["source"] = source
+    return source
+
+
+# Regex searches for annotations like: # .. toggle
+# It is matched against lines stripped of their leading whitespace.
+_ANNOTATION_REGEX = re.compile(r"#\s*\.\.\s*toggle")
+
+
+def get_annotated_line_numbers(source):
+    """
+    Get the numbers of the lines of `source` which are toggle annotations.
+    """
+    annotated_line_numbers = set()
+    for line_number, line in enumerate(source.split("\n"), start=1):
+        line = line.lstrip()
+        # Most lines are not comments: reject them without entering the regex engine.
+        if line.startswith("#") and _ANNOTATION_REGEX.match(line):
+            annotated_line_numbers.add(line_number)
+    return frozenset(annotated_line_numbers)
 
 
 @check_visitors
-class FeatureToggleChecker(BaseChecker):
+class FeatureToggleChecker(ModuleCacheMixin, BaseChecker):
     """
     Checks that feature toggles are properly annotated and best practices
     are followed.
@@ -96,9 +149,8 @@ class FeatureToggleChecker(BaseChecker):
     TOGGLE_NOT_ANNOTATED_MESSAGE_ID = "feature-toggle-needs-doc"
     ILLEGAL_WAFFLE_MESSAGE_ID = "illegal-waffle-usage"
 
-    _CHECK_CAPITAL_REGEX = re.compile(r"[A-Z]")
     _WAFFLE_TOGGLE_CLASSES = ("WaffleFlag", "WaffleSwitch", "CourseWaffleFlag")
-    _ILLEGAL_WAFFLE_FUNCTIONS = ["flag_is_active", "switch_is_active"]
+    _ILLEGAL_WAFFLE_FUNCTIONS = frozenset(("flag_is_active", "switch_is_active"))
 
     msgs = {
         ("E%d40" % BASE_ID): (
@@ -119,29 +171,81 @@ class FeatureToggleChecker(BaseChecker):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._lines = None
+        self._annotated_line_numbers = frozenset()
+        self._has_waffle_classes = False
+        self._has_illegal_waffle_functions = False
+        self._has_configuration_models = False
+        self._has_feature_flags = False
+        # (msgid, args, node) tuples of the messages found in the current module
+        self._pending_messages = []
 
+    @utils.only_required_for_messages(TOGGLE_NOT_ANNOTATED_MESSAGE_ID, ILLEGAL_WAFFLE_MESSAGE_ID)
     def visit_module(self, node):
-        """Parses the module code to provide access to comments."""
-        self._lines = AnnotationLines(node)
+        """
+        Performs all checks on the Call, ClassDef and Dict nodes of the module.
+
+        The raw module source is scanned once for the names each check looks
+        for, and the module is only walked for the node types that may fail a
+        check. Modules which cannot contain any toggle are not walked at all.
+        """
+        self._pending_messages.clear()
+
+        source = get_module_source(node)
+        # All the toggle classes contain "Waffle".
+        self._has_waffle_classes = "Waffle" in source
+        # All the illegal waffle functions end with "_is_active".
+        self._has_illegal_waffle_functions = "_is_active" in source
+        self._has_configuration_models = "ConfigurationModel" in source
+        self._has_feature_flags = "FEATURES" in source
+
+        node_classes = []
+        if self._has_waffle_classes or self._has_illegal_waffle_functions:
+            node_classes.append(Call)
+        if self._has_configuration_models:
+            node_classes.append(ClassDef)
+        if self._has_feature_flags:
+            node_classes.append(Dict)
+        if not node_classes:
+            return
+
+        # Every annotation matched by _ANNOTATION_REGEX contains "toggle".
+        if "toggle" in source:
+            self._annotated_line_numbers = get_annotated_line_numbers(source)
+        else:
+            self._annotated_line_numbers = frozenset()
+
+        for child in node.nodes_of_class(tuple(node_classes)):
+            if isinstance(child, Call):
+                self.check_waffle_class_annotated(child)
+                self.check_illegal_waffle_usage(child)
+            elif isinstance(child, ClassDef):
+                self.check_configuration_model_annotated(child)
+            else:
+                self.check_django_feature_flag_annotated(child)
+
+    def _is_message_enabled(self, msgid, node):
+        """
+        Checks if the message is enabled on the line where it would be added for the node.
+        """
+        return self.linter.is_message_enabled(msgid, line=node.fromlineno)
 
     def check_waffle_class_annotated(self, node):
         """
         Check Call node for waffle class instantiation with missing annotations.
         """
-        if not hasattr(node.func, "name"):
+        if not self._has_waffle_classes:
             return
 
-        # Looking for class instantiation, so should start with a capital letter
-        starts_with_capital = self._CHECK_CAPITAL_REGEX.match(node.func.name)
-        if not starts_with_capital:
+        name = getattr(node.func, "name", None)
+        if name is None:
             return
 
-        # Search for toggle classes that require an annotation
-        if not node.func.name.endswith(self._WAFFLE_TOGGLE_CLASSES):
+        # Search for toggle classes that require an annotation. Looking for
+        # class instantiation, so the name should start with a capital letter.
+        if not name.endswith(self._WAFFLE_TOGGLE_CLASSES) or not name[:1].isupper():
             return
 
-        if not self._lines.is_line_annotated(node.lineno - 1):
+        if node.lineno - 1 not in self._annotated_line_numbers:
             feature_toggle_name = "UNKNOWN"
 
             if node.keywords is not None:
@@ -149,14 +253,16 @@ class FeatureToggleChecker(BaseChecker):
                     if node_key.arg == "flag_name":
                         feature_toggle_name = node_key.value.value
 
-            if feature_toggle_name == "UNKNOWN":
+            # Only render the toggle name if the message is enabled for this line. The message is still added
+            # either way, so that pylint records the use of a disable pragma.
+            if feature_toggle_name == "UNKNOWN" and self._is_message_enabled(
+                self.TOGGLE_NOT_ANNOTATED_MESSAGE_ID, node
+            ):
                 if len(node.args) >= 2:
                     feature_toggle_name = node.args[1].as_string()
 
-            self.add_message(
-                self.TOGGLE_NOT_ANNOTATED_MESSAGE_ID,
-                args=(feature_toggle_name,),
-                node=node,
+            self._pending_messages.append(
+                (self.TOGGLE_NOT_ANNOTATED_MESSAGE_ID, (feature_toggle_name,), node)
             )
 
     def check_configuration_model_annotated(self, node):
@@ -164,15 +270,20 @@ class FeatureToggleChecker(BaseChecker):
         Checks class definitions to see if they subclass ConfigurationModel.
         If they do, they should be correctly annotated.
         """
-        if "ConfigurationModel" not in node.basenames:
+        if not self._has_configuration_models:
+            return
+        # node.basenames renders every base class with as_string(): only look
+        # for a plain ConfigurationModel name, and stop at the first match.
+        if not any(
+            isinstance(base, Name) and base.name == "ConfigurationModel"
+            for base in node.bases
+        ):
             return
-        if not self._lines.is_line_annotated(node.lineno - 1):
+        if node.lineno - 1 not in self._annotated_line_numbers:
             config_model_subclass_name = node.name
 
-            self.add_message(
-                self.TOGGLE_NOT_ANNOTATED_MESSAGE_ID,
-                args=(config_model_subclass_name,),
-                node=node,
+            self._pending_messages.append(
+                (self.TOGGLE_NOT_ANNOTATED_MESSAGE_ID, (config_model_subclass_name,), node)
             )
 
     def check_django_feature_flag_annotated(self, node):
@@ -181,65 +292,113 @@ class FeatureToggleChecker(BaseChecker):
         dict FEATURES is being set. If it is, entries should be
         correctly annotated.
         """
-        try:
-            parent_target_name = node.parent.targets[0].name
-        except AttributeError:
+        if not self._has_feature_flags:
             return
 
-        if parent_target_name == "FEATURES":
+        # Most dicts are not assigned to a single name: reject them without raising AttributeError
+        parent = node.parent
+        if not isinstance(parent, Assign):
+            return
+
+        if getattr(parent.targets[0], "name", None) == "FEATURES":
             for key, _ in node.items:
-                if not self._lines.is_line_annotated(key.lineno - 1):
+                if key.lineno - 1 not in self._annotated_line_numbers:
                     django_feature_toggle_name = key.value
 
-                    self.add_message(
-                        self.TOGGLE_NOT_ANNOTATED_MESSAGE_ID,
-                        args=(django_feature_toggle_name,),
-                        node=node,
+                    self._pending_messages.append(
+                        (self.TOGGLE_NOT_ANNOTATED_MESSAGE_ID, (django_feature_toggle_name,), node)
                     )
 
     def check_illegal_waffle_usage(self, node):
         """
         Check Call node for illegal waffle calls.
         """
-        if not hasattr(node.func, "name"):
+        if not self._has_illegal_waffle_functions:
             return
 
-        if node.func.name in self._ILLEGAL_WAFFLE_FUNCTIONS:
+        if getattr(node.func, "name", None) in self._ILLEGAL_WAFFLE_FUNCTIONS:
             feature_toggle_name = "UNKNOWN"
-            if len(node.args) >= 1:
+            # Only render the toggle name if the message is enabled for this line. The message is still added
+            # either way, so that pylint records the use of a disable pragma.
+            if len(node.args) >= 1 and self._is_message_enabled(self.ILLEGAL_WAFFLE_MESSAGE_ID, node):
                 feature_toggle_name = node.args[0].as_string()
 
-            self.add_message(
-                self.ILLEGAL_WAFFLE_MESSAGE_ID, args=(feature_toggle_name,), node=node
+            self._pending_messages.append(
+                (self.ILLEGAL_WAFFLE_MESSAGE_ID, (feature_toggle_name,), node)
             )
 
     @utils.only_required_for_messages(TOGGLE_NOT_ANNOTATED_MESSAGE_ID, ILLEGAL_WAFFLE_MESSAGE_ID)
-    def visit_call(self, node):
+    def leave_module(self, _node):
         """
-        Performs various checks on Call nodes.
+        Emits all the messages found in the module at once.
         """
-        self.check_waffle_class_annotated(node)
-        self.check_illegal_waffle_usage(node)
+        for msgid, args, node in self._pending_messages:
+            self.add_message(msgid, args=args, node=node)
+        self._pending_messages.clear()
 
-    @utils.only_required_for_messages(TOGGLE_NOT_ANNOTATED_MESSAGE_ID)
-    def visit_classdef(self, node):
-        """
-        Checks class definitions for potential ConfigurationModel
-        implementations.
-        """
-        self.check_configuration_model_annotated(node)
 
-    @utils.only_required_for_messages(TOGGLE_NOT_ANNOTATED_MESSAGE_ID)
-    def visit_dict(self, node):
-        """
-        Checks Dict nodes in case a Django FEATURES dictionary is being
-        initialized.
-        """
-        self.check_django_feature_flag_annotated(node)
+@functools.lru_cache(maxsize=None)
+def get_config_search(config_filename):
+    """
+    Get the annotation configuration and search objects for a code_annotations configuration file.
+
+    Loading the configuration parses its YAML file and loads the search extensions: this is only done once per
+    configuration file, and the result is shared between all checker instances.
+
+    Arguments:
+        config_filename: Name of a file located in code_annotations/contrib/config.
+
+    Returns:
+        (config, search) tuple.
+    """
+    config_path = str(
+        importlib.resources.files("code_annotations").joinpath(
+            "contrib", "config", config_filename
+        )
+    )
+    config = AnnotationConfig(config_path, verbosity=-1)
+    search = StaticSearch(config)
+    return config, search
+
+
+@functools.lru_cache(maxsize=None)
+def get_annotation_tokens_prefix(config):
+    """
+    Get the longest prefix shared by all the annotation tokens of a configuration, such as ".. toggle_".
+
+    A module which does not contain this prefix cannot contain any of the annotations of the configuration, which can
+    be checked with a single substring search.
+    """
+    return os.path.commonprefix(config.annotation_tokens)
+
+
+def search_file(search, path, source):
+    """
+    Search the source of a single file for annotations.
+
+    This is the single-file part of `StaticSearch.search()`, without the source tree walk and the rebuilding of the
+    extension maps on every call. The file is not read again: `source` is the module source shared with the other
+    checkers.
+
+    Returns:
+        List of found annotations.
+    """
+    config = search.config
+    # Annotation filenames are relative to the source path
+    config.source_path = path
+    filename_extension = os.path.splitext(path)[1][1:]
+    all_results = {}
+    # Translate line endings, as reading the file in text mode would
+    file_handle = io.StringIO(source, newline=None)
+    file_handle.name = path
+    results = config.mgr.map(search.search_extension, file_handle, config.extensions, filename_extension)
+    search.format_file_results(all_results, [r for _, r in results])
+    # Results are keyed by filename, and they are all for this file
+    return all_results.popitem()[1] if all_results else []
 
 
 @check_visitors
-class AnnotationBaseChecker(BaseChecker):
+class AnnotationBaseChecker(ModuleCacheMixin, BaseChecker):
     """
     Code annotation checkers should almost certainly inherit from this class.
 
@@ -251,31 +410,37 @@ class AnnotationBaseChecker(BaseChecker):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.config_search = []
-        for config_filename in self.CONFIG_FILENAMES:
-            config_path = str(
-                importlib.resources.files("code_annotations").joinpath(
-                    "contrib", "config", config_filename
-                )
-            )
-            config = AnnotationConfig(config_path, verbosity=-1)
-            search = StaticSearch(config)
-            self.config_search.append((config, search))
-            self.current_module_annotations = []
+        self.current_module_annotations = []
+
+    @property
+    def config_search(self):
+        """
+        List of (config, search) pairs, one per CONFIG_FILENAMES entry.
+
+        They are created on first use and shared with the other checkers.
+        """
+        return [get_config_search(config_filename) for config_filename in self.CONFIG_FILENAMES]
 
     def check_module(self, node):
         """
         Perform checks on all annotation groups for this module.
         """
+        path = node.path[0]
+        source = get_module_source(node)
         for config, search in self.config_search:
-            # This is a hack to avoid re-creating AnnotationConfig every time
-            config.source_path = node.path[0]
-            all_results = search.search()
-
-            for _file_name, results in all_results.items():
-                for annotations_group in search.iter_groups(results):
-                    self.current_module_annotations.append(annotations_group)
-                    self.check_annotation_group(search, annotations_group, node)
+            # Most modules have no annotations at all: skip the search unless one of the tokens is present
+            if get_annotation_tokens_prefix(config) not in source:
+                continue
+            if not any(token in source for token in config.annotation_tokens):
+                continue
+            # Checkers which share a configuration share the search results of the module
+            module_data = _module_cache.get(node)
+            if search not in module_data:
+                module_data[search] = search_file(search, path, source)
+            annotations = module_data[search]
+            for annotations_group in search.iter_groups(annotations):
+                self.current_module_annotations.append(annotations_group)
+                self.check_annotation_group(search, annotations_group, node)
 
     def leave_module(self, _node):
         self.current_module_annotations.clear()
@@ -381,14 +546,23 @@ class FeatureToggleAnnotationChecker(AnnotationBaseChecker):
         ),
     }
 
-    TOGGLE_FUNC_NAMES = [
+    TOGGLE_FUNC_NAMES = frozenset((
         "WaffleFlag",
         "NonNamespacedWaffleFlag",
         "WaffleSwitch",
         "NonNamespacedWaffleSwitch",
         "CourseWaffleFlag",
         "ExperimentWaffleFlag",
-    ]
+    ))
+
+    # Toggle fields defined by each annotation token
+    ANNOTATION_TOKEN_FIELDS = {
+        ".. toggle_name:": "name",
+        ".. toggle_description:": "description",
+        ".. toggle_use_cases:": "use_cases",
+        ".. toggle_target_removal_date:": "target_removal_date",
+        ".. toggle_default:": "default",
+    }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -413,28 +587,27 @@ class FeatureToggleAnnotationChecker(AnnotationBaseChecker):
         if not annotations:
             return
 
-        target_removal_date = None
+        fields = {}
         temporary_use_case = False
-        toggle_name = ""
-        toggle_description = ""
-        toggle_default = None
         line_number = None
         for annotation in annotations:
             if line_number is None:
                 line_number = annotation["line_number"]
                 self.current_module_annotation_group_line_numbers.append(line_number)
-            if annotation["annotation_token"] == ".. toggle_name:":
-                toggle_name = annotation["annotation_data"]
-                self.current_module_annotated_toggle_names.add(toggle_name)
-            elif annotation["annotation_token"] == ".. toggle_description:":
-                toggle_description = annotation["annotation_data"].strip()
-            elif annotation["annotation_token"] == ".. toggle_use_cases:":
-                if "temporary" in annotation["annotation_data"]:
-                    temporary_use_case = True
-            elif annotation["annotation_token"] == ".. toggle_target_removal_date:":
-                target_removal_date = annotation["annotation_data"]
-            elif annotation["annotation_token"] == ".. toggle_default:":
-                toggle_default = annotation["annotation_data"]
+            field = self.ANNOTATION_TOKEN_FIELDS.get(annotation["annotation_token"])
+            if field is None:
+                continue
+            fields[field] = annotation["annotation_data"]
+            if field == "name":
+                self.current_module_annotated_toggle_names.add(annotation["annotation_data"])
+            elif field == "use_cases" and "temporary" in annotation["annotation_data"]:
+                # Any use_cases annotation of the group may make the toggle temporary
+                temporary_use_case = True
+
+        toggle_name = fields.get("name", "")
+        toggle_description = fields.get("description", "").strip()
+        target_removal_date = fields.get("target_removal_date")
+        toggle_default = fields.get("default")
 
         if not toggle_name:
             self.add_message(
@@ -456,7 +629,7 @@ class FeatureToggleAnnotationChecker(AnnotationBaseChecker):
                 node=node,
                 line=line_number,
             )
-        if toggle_default not in ["True", "False"]:
+        if toggle_default not in {"True", "False"}:
             self.add_message(
                 self.NON_BOOLEAN_DEFAULT_VALUE,
                 args=(toggle_name,),
@@ -563,7 +736,7 @@ class SettingAnnotationChecker(AnnotationBaseChecker):
             elif annotation["annotation_token"] == ".. setting_default:":
                 setting_default = annotation["annotation_data"]
 
-        if setting_default in ["True", "False"]:
+        if setting_default in {"True", "False"}:
             self.add_message(
                 self.BOOLEAN_DEFAULT_VALUE,
                 args=(setting_name,),
@@ -4,6 +4,7 @@ import re
 import textwrap
 import warnings
 
+from astroid import MANAGER
 from pylint.lint import Run
 from pylint.reporters import CollectingReporter
 
@@ -41,7 +42,7 @@ class SimpleReporter(CollectingReporter):
         pass
 
 
-def run_pylint(source, msg_ids, *cmd_args):
+def run_pylint(source, msg_ids, *cmd_args, encoding=None):
     """Run pylint on some source, collecting specific messages.
 
     `source` is the literal text of the program to check. It is
@@ -53,6 +54,8 @@ def run_pylint(source, msg_ids, *cmd_args):
     `*cmd_args` is the optional list of command line arguments. If calling
     function wants to send some additional command line arguments.
 
+    `encoding` is the optional encoding used to write the source file.
+
     Returns a set of messages.  Each message is a string, formatted
     as "line:msg-id:message".  "line" will be the line number of the
     message, or if the source line has a comment like "#=Slug", then
@@ -60,8 +63,10 @@ def run_pylint(source, msg_ids, *cmd_args):
     and maintain the tests.
 
     """
-    with open("source.py", "w") as f:
+    with open("source.py", "w", encoding=encoding) as f:
         f.write(textwrap.dedent(source))
+    # source.py is rewritten for every run: don't let astroid serve the module from a previous run.
+    MANAGER.astroid_cache.pop("source", None)
 
     reporter = SimpleReporter()
 
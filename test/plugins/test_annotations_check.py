@@ -46,6 +46,24 @@ def test_waffle_missing_toggle_annotation_check():
     assert expected == messages
 
 
+def test_waffle_missing_toggle_annotation_without_any_annotation():
+    source = """\
+        from edx_toggles.toggles import WaffleSwitch
+
+        SWITCH = WaffleSwitch(NAMESPACE, 'unannotated_switch') #=A
+
+        class NotAConfigurationModelClass():
+            pass
+        """
+
+    msg_ids = "feature-toggle-needs-doc"
+    messages = run_pylint(source, msg_ids)
+    expected = {
+        "A:feature-toggle-needs-doc:feature toggle ('unannotated_switch') is missing annotation",
+    }
+    assert expected == messages
+
+
 def test_config_models_missing_doc():
     source = """\
         from config_models.models import ConfigurationModel
@@ -143,6 +161,24 @@ def test_illegal_waffle_usage_check():
     assert expected == messages
 
 
+def test_disabled_toggle_messages_are_not_useless_suppressions():
+    source = """\
+        SWITCH = WaffleSwitch(NAMESPACE, 'disabled_switch')  # pylint: disable=feature-toggle-needs-doc
+
+        flag_is_active(request, 'disabled_flag')  # pylint: disable=illegal-waffle-usage
+
+        OTHER_SWITCH = WaffleSwitch(NAMESPACE, OTHER_SWITCH_NAME)  # pylint: disable=illegal-waffle-usage  #=A
+        """
+
+    msg_ids = "feature-toggle-needs-doc,illegal-waffle-usage,useless-suppression"
+    messages = run_pylint(source, msg_ids)
+    expected = {
+        "A:feature-toggle-needs-doc:feature toggle (OTHER_SWITCH_NAME) is missing annotation",
+        "A:useless-suppression:Useless suppression of 'illegal-waffle-usage'",
+    }
+    assert expected == messages
+
+
 def test_code_annotations_checker():
     source = """
     # .. toggle_name: MYTOGGLE
@@ -167,6 +203,19 @@ def test_temporary_use_case_without_target_removal_date():
     assert expected == messages
 
 
+def test_temporary_use_case_followed_by_other_use_case():
+    source = """
+    # .. toggle_name: MYTOGGLE
+    # .. toggle_use_cases: temporary
+    # .. toggle_use_cases: open_edx
+    """
+    messages = run_pylint(source, "toggle-missing-target-removal-date")
+    expected = {
+        "2:toggle-missing-target-removal-date:temporary feature toggle (MYTOGGLE) has no target removal date"
+    }
+    assert expected == messages
+
+
 def test_empty_removal_date_on_permanent_use_case():
     source = """
     # .. toggle_name: MYTOGGLE
@@ -280,3 +329,23 @@ def test_invalid_import_from_django_waffle():
         "3:invalid-django-waffle-import:invalid Django Waffle import",
     }
     assert expected == messages
+
+
+def test_latin1_module():
+    source = """\
+    # -*- coding: latin-1 -*-
+
+    # .. toggle_name: CAFÉ_FLAG
+    # .. toggle_use_cases: temporary
+    CAFE_FLAG = WaffleFlag(NAMESPACE, 'CAFÉ_FLAG')
+
+    UNANNOTATED_FLAG = WaffleFlag(NAMESPACE, 'DÉJÀ_VU')  #=A
+    """
+    messages = run_pylint(
+        source, "feature-toggle-needs-doc,toggle-missing-target-removal-date", encoding="latin-1"
+    )
+    expected = {
+        "3:toggle-missing-target-removal-date:temporary feature toggle (CAFÉ_FLAG) has no target removal date",
+        "A:feature-toggle-needs-doc:feature toggle ('DÉJÀ_VU') is missing annotation",
+    }
+    assert expected == messages